@@ -1,52 +1,130 @@
 import subprocess
 import os
+import io
 import shutil
 from pathlib import Path
 import json
 import tempfile
 import time
 import zipfile
-import xml.etree.ElementTree as ET
+import lxml.etree as LET
 import mido
+import numpy as np
+from numba import njit
 import re
-from collections import defaultdict
+import functools
+import logging
+
+log = logging.getLogger(__name__)
+
+# Etiquetas que nos interesan durante el parseo en streaming del mscx
+_METADATA_TAGS = ('metaTag', 'workTitle', 'Tempo', 'KeySig', 'TimeSig', 'Part')
+
+# Constantes de sondeo de MuseScore, construidas una sola vez al importar
+_POSSIBLE_MS_PATHS = (
+    r"C:\Program Files\MuseScore 4\bin\MuseScore4.exe",
+    r"C:\Program Files\MuseScore 3\bin\MuseScore3.exe",
+    r"C:\Program Files (x86)\MuseScore 4\bin\MuseScore4.exe",
+    r"C:\Program Files (x86)\MuseScore 3\bin\MuseScore3.exe",
+    "/Applications/MuseScore 4.app/Contents/MacOS/mscore",
+    "/Applications/MuseScore 3.app/Contents/MacOS/mscore",
+    "/usr/bin/musescore4",
+    "/usr/bin/musescore3",
+    "/usr/bin/mscore",
+    "/snap/bin/musescore",
+)
+_MS_CMDS = ("musescore4", "musescore3", "mscore", "MuseScore4", "MuseScore3")
+
+# Entrada de partitura dentro del zip: el .mscx tiene prioridad; los nombres
+# con 'score' son solo un último recurso (los MSCZ de MuseScore 4 incluyen
+# p.ej. score_style.mss, que NO es la partitura)
+_MSCX_RE = re.compile(r'\.mscx$', re.IGNORECASE)
+_SCORE_FALLBACK_RE = re.compile(r'score', re.IGNORECASE)
+
+# XPath compilados una sola vez para los subárboles de <Part>
+_INSTRUMENT_XP = LET.XPath('.//Instrument')
+_CHANNEL_XP = LET.XPath('.//channel')
+
+# Códigos de tipo para el buffer SoA (structure-of-arrays) de eventos MIDI
+_EV_NOTE_ON, _EV_NOTE_OFF, _EV_CONTROL, _EV_PROGRAM = 0, 1, 2, 3
+_EV_TYPE_CODES = {
+    'note_on': _EV_NOTE_ON,
+    'note_off': _EV_NOTE_OFF,
+    'control_change': _EV_CONTROL,
+    'program_change': _EV_PROGRAM,
+}
+
+
+@njit(cache=True)
+def _hist_and_range(notes):
+    """Histograma de 128 notas y rango [min, max] en una pasada compilada"""
+    counts = np.zeros(128, dtype=np.int32)
+    lo, hi = 127, 0
+    for n in notes:
+        counts[n] += 1
+        if n < lo:
+            lo = n
+        if n > hi:
+            hi = n
+    return counts, lo, hi
+
+
+@njit(cache=True)
+def _best_split(counts, lo, hi):
+    """Busca el valle de menor densidad (ventana de 5 notas) con suma móvil"""
+    if hi < lo:
+        return 60
+
+    # Limitar búsqueda al rango razonable para piano (Do3..Do5)
+    start = max(48, lo)
+    end = min(72, hi)
+    if end < start:
+        return 60
+
+    density = 0
+    for n in range(max(start - 2, 0), min(start + 3, 128)):
+        density += counts[n]
+
+    best = start
+    min_density = density
+    for c in range(start + 1, end + 1):
+        if c + 2 < 128:
+            density += counts[c + 2]
+        if c - 3 >= 0:
+            density -= counts[c - 3]
+        if density < min_density:
+            min_density = density
+            best = c
+    return best
+
+
+@functools.lru_cache(maxsize=None)
+def _find_musescore_executable(custom_path=None):
+    """Encuentra el ejecutable de MuseScore en el sistema (resultado memoizado)"""
+    if custom_path and os.path.exists(custom_path):
+        return custom_path
+
+    for cmd in _MS_CMDS:
+        found = shutil.which(cmd)
+        if found:
+            return found
+
+    for path in _POSSIBLE_MS_PATHS:
+        if os.path.exists(path):
+            return path
+
+    return None
 
 class AdvancedMSCZConverter:
-    def __init__(self, musescore_path=None):
+    def __init__(self, musescore_path=None, debug_mode=False):
         """
         Conversor avanzado que preserva exactamente el timing y la estructura musical
         """
-        self.musescore_path = self._find_musescore_executable(musescore_path)
-        self.debug_mode = True
-        
-    def _find_musescore_executable(self, custom_path=None):
-        """Encuentra el ejecutable de MuseScore en el sistema"""
-        if custom_path and os.path.exists(custom_path):
-            return custom_path
-        
-        possible_paths = [
-            r"C:\Program Files\MuseScore 4\bin\MuseScore4.exe",
-            r"C:\Program Files\MuseScore 3\bin\MuseScore3.exe",
-            r"C:\Program Files (x86)\MuseScore 4\bin\MuseScore4.exe",
-            r"C:\Program Files (x86)\MuseScore 3\bin\MuseScore3.exe",
-            "/Applications/MuseScore 4.app/Contents/MacOS/mscore",
-            "/Applications/MuseScore 3.app/Contents/MacOS/mscore",
-            "/usr/bin/musescore4",
-            "/usr/bin/musescore3",
-            "/usr/bin/mscore",
-            "/snap/bin/musescore"
-        ]
-        
-        for cmd in ["musescore4", "musescore3", "mscore", "MuseScore4", "MuseScore3"]:
-            if shutil.which(cmd):
-                return shutil.which(cmd)
-        
-        for path in possible_paths:
-            if os.path.exists(path):
-                return path
-        
-        return None
-    
+        self.musescore_path = _find_musescore_executable(musescore_path)
+        self.debug_mode = debug_mode
+        self._ms_version = None
+
+
     def extract_mscz_metadata(self, mscz_file):
         """
         Extrae metadatos completos del archivo MSCZ
@@ -65,170 +143,193 @@ class AdvancedMSCZConverter:
         }
         
         try:
-            print(f"📋 Extrayendo metadatos de {Path(mscz_file).name}...")
+            log.info("📋 Extrayendo metadatos de %s...", Path(mscz_file).name)
             
             if not os.path.exists(mscz_file):
-                print(f"❌ El archivo no existe: {mscz_file}")
+                log.error("❌ El archivo no existe: %s", mscz_file)
                 return metadata
             
             # Los archivos MSCZ son archivos ZIP
             with zipfile.ZipFile(mscz_file, 'r') as zip_file:
-                # Buscar el archivo principal de la partitura
-                score_files = [f for f in zip_file.namelist() if f.endswith('.mscx')]
-                if not score_files:
-                    score_files = [f for f in zip_file.namelist() if 'score' in f.lower()]
-                
-                if not score_files:
-                    print("⚠️  No se encontró archivo de partitura en el MSCZ")
+                # Buscar el archivo principal de la partitura en una sola
+                # pasada: el primer .mscx gana (con salida temprana); el
+                # primer nombre con 'score' solo se usa si no hay ninguno
+                score_name = None
+                fallback_name = None
+                for n in zip_file.namelist():
+                    if _MSCX_RE.search(n):
+                        score_name = n
+                        break
+                    if fallback_name is None and _SCORE_FALLBACK_RE.search(n):
+                        fallback_name = n
+                if score_name is None:
+                    score_name = fallback_name
+
+                if score_name is None:
+                    log.warning("⚠️  No se encontró archivo de partitura en el MSCZ")
                     return metadata
-                
-                print(f"📄 Usando archivo de partitura: {score_files[0]}")
-                
-                # Leer el contenido XML
-                with zip_file.open(score_files[0]) as score_file:
-                    xml_content = score_file.read().decode('utf-8')
-                    
+
+                log.info("📄 Usando archivo de partitura: %s", score_name)
+
+                # Parsear el XML en streaming (lxml.iterparse): una sola pasada
+                # sobre el documento, sin materializarlo entero en memoria.
+                with zip_file.open(score_name) as score_file:
                     if self.debug_mode:
+                        # Tee en memoria: el volcado de depuración se escribe a
+                        # disco sin releer el XML desde allí para parsearlo
+                        buffer = io.BytesIO()
+                        shutil.copyfileobj(score_file, buffer, length=1 << 20)
                         debug_path = Path(mscz_file).with_suffix('.debug.xml')
-                        with open(debug_path, 'w', encoding='utf-8') as debug_file:
-                            debug_file.write(xml_content)
-                        print(f"🐛 XML guardado para debug en: {debug_path}")
-                
-                # Parsear XML
-                root = ET.fromstring(xml_content)
-                
-                # Extraer metadatos básicos
-                self._extract_basic_metadata(root, metadata)
-                
-                # Extraer información musical
-                self._extract_musical_info(root, metadata)
-                
-                # Extraer información de partes/instrumentos
-                self._extract_parts_info(root, metadata)
+                        with open(debug_path, 'wb') as debug_file:
+                            debug_file.write(buffer.getbuffer())
+                        log.debug("🐛 XML guardado para debug en: %s", debug_path)
+                        buffer.seek(0)
+                        self._stream_extract_metadata(buffer, metadata)
+                    else:
+                        self._stream_extract_metadata(score_file, metadata)
             
-            print("✅ Metadatos extraídos:")
+            log.info("✅ Metadatos extraídos:")
             for key, value in metadata.items():
                 if value and key != 'parts':
-                    print(f"   {key.title()}: {value}")
+                    log.info("   %s: %s", key.title(), value)
             
             if metadata['parts']:
-                print(f"   Partes: {len(metadata['parts'])} instrumentos")
+                log.info("   Partes: %s instrumentos", len(metadata['parts']))
                 for part in metadata['parts']:
-                    print(f"      - {part['name']} (Canal {part.get('channel', 'N/A')})")
+                    log.info("      - %s (Canal %s)", part['name'], part.get('channel', 'N/A'))
             
             return metadata
             
         except Exception as e:
-            print(f"❌ Error extrayendo metadatos: {e}")
+            log.error("❌ Error extrayendo metadatos: %s", e)
             import traceback
             traceback.print_exc()
             return metadata
     
-    def _extract_basic_metadata(self, root, metadata):
-        """Extrae metadatos básicos del XML"""
-        meta_tags = root.findall('.//metaTag')
-        
-        for meta_tag in meta_tags:
-            name = meta_tag.get('name', '').lower()
-            value = meta_tag.text
-            
-            if value:
-                if name in ['worktitle', 'title']:
-                    metadata['title'] = value
-                elif name in ['composer']:
-                    metadata['composer'] = value
-                elif name in ['lyricist', 'poet']:
-                    metadata['lyricist'] = value
-                elif name in ['copyright']:
-                    metadata['copyright'] = value
-                elif name in ['subtitle']:
-                    metadata['subtitle'] = value
-                elif name in ['artist', 'arranger']:
-                    metadata['artist'] = value
-        
-        # Buscar también en otros elementos
-        work_title = root.find('.//workTitle')
-        if work_title is not None and work_title.text:
-            metadata['title'] = work_title.text
-        
+    def _stream_extract_metadata(self, source, metadata):
+        """
+        Recorre el mscx en una única pasada con lxml.iterparse, despachando
+        cada etiqueta de interés al extractor correspondiente y liberando los
+        elementos ya procesados para mantener acotado el uso de memoria.
+        """
+        saw_work_title = False
+
+        for _, elem in LET.iterparse(source, events=('end',), tag=_METADATA_TAGS):
+            tag = elem.tag
+
+            if tag == 'metaTag':
+                self._extract_basic_metadata(elem, metadata, saw_work_title)
+            elif tag == 'workTitle':
+                # workTitle tiene prioridad sobre el metaTag 'title'
+                if elem.text:
+                    metadata['title'] = elem.text
+                    saw_work_title = True
+            elif tag in ('Tempo', 'KeySig', 'TimeSig'):
+                self._extract_musical_info(elem, metadata)
+            elif tag == 'Part':
+                self._extract_parts_info(elem, metadata)
+
+            # Liberar el elemento y los hermanos ya consumidos
+            elem.clear()
+            parent = elem.getparent()
+            if parent is not None:
+                while elem.getprevious() is not None:
+                    del parent[0]
+
         # Si no hay artista, usar compositor
         if not metadata['artist'] and metadata['composer']:
             metadata['artist'] = metadata['composer']
-    
-    def _extract_musical_info(self, root, metadata):
-        """Extrae información musical (tempo, compás, tonalidad)"""
+
+    def _extract_basic_metadata(self, meta_tag, metadata, saw_work_title=False):
+        """Extrae metadatos básicos de un elemento <metaTag>"""
+        name = meta_tag.get('name', '').lower()
+        value = meta_tag.text
+
+        if value:
+            if name in ['worktitle', 'title']:
+                if not saw_work_title:
+                    metadata['title'] = value
+            elif name in ['composer']:
+                metadata['composer'] = value
+            elif name in ['lyricist', 'poet']:
+                metadata['lyricist'] = value
+            elif name in ['copyright']:
+                metadata['copyright'] = value
+            elif name in ['subtitle']:
+                metadata['subtitle'] = value
+            elif name in ['artist', 'arranger']:
+                metadata['artist'] = value
+
+    def _extract_musical_info(self, elem, metadata):
+        """Extrae información musical (tempo, compás, tonalidad) de un elemento"""
         try:
-            # Buscar tempo
-            tempo_elements = root.findall('.//Tempo')
-            if tempo_elements:
-                for tempo in tempo_elements:
-                    tempo_text = tempo.find('tempo')
-                    if tempo_text is not None:
-                        metadata['tempo'] = float(tempo_text.text)
-                        break
-            
-            # Buscar armadura de clave
-            key_sig_elements = root.findall('.//KeySig')
-            if key_sig_elements:
-                accidentals = key_sig_elements[0].find('accidentals')
+            tag = elem.tag
+
+            # Tempo: nos quedamos con el primero que tenga valor
+            if tag == 'Tempo' and metadata['tempo'] is None:
+                tempo_text = elem.find('tempo')
+                if tempo_text is not None:
+                    metadata['tempo'] = float(tempo_text.text)
+
+            # Armadura de clave: la primera del documento
+            elif tag == 'KeySig' and metadata['key_signature'] is None:
+                accidentals = elem.find('accidentals')
                 if accidentals is not None:
                     metadata['key_signature'] = int(accidentals.text)
-            
-            # Buscar compás
-            time_sig_elements = root.findall('.//TimeSig')
-            if time_sig_elements:
-                numerator = time_sig_elements[0].find('sigN')
-                denominator = time_sig_elements[0].find('sigD')
+
+            # Compás: el primero del documento
+            elif tag == 'TimeSig' and metadata['time_signature'] is None:
+                numerator = elem.find('sigN')
+                denominator = elem.find('sigD')
                 if numerator is not None and denominator is not None:
                     metadata['time_signature'] = f"{numerator.text}/{denominator.text}"
-            
+
         except Exception as e:
-            print(f"⚠️  Error extrayendo información musical: {e}")
-    
-    def _extract_parts_info(self, root, metadata):
-        """Extrae información de las partes/instrumentos"""
+            log.warning("⚠️  Error extrayendo información musical: %s", e)
+
+    def _extract_parts_info(self, part, metadata):
+        """Extrae información de una parte/instrumento a partir de su <Part>"""
         try:
-            parts = root.findall('.//Part')
-            print(f"🎼 Encontradas {len(parts)} partes")
-            
-            for i, part in enumerate(parts):
-                part_info = {
-                    'id': part.get('id', f'part_{i}'),
-                    'name': 'Piano',
-                    'channel': i
-                }
-                
-                # Buscar nombre del instrumento
-                instrument = part.find('.//Instrument')
-                if instrument is not None:
-                    long_name = instrument.find('longName')
-                    short_name = instrument.find('shortName')
-                    
-                    if long_name is not None and long_name.text:
-                        part_info['name'] = long_name.text
-                    elif short_name is not None and short_name.text:
-                        part_info['name'] = short_name.text
-                
-                # Buscar información del canal MIDI
-                channel_elem = instrument.find('.//channel') if instrument is not None else None
-                if channel_elem is not None:
-                    part_info['channel'] = int(channel_elem.get('channel', i))
-                
-                metadata['parts'].append(part_info)
-                
+            i = len(metadata['parts'])
+            part_info = {
+                'id': part.get('id', f'part_{i}'),
+                'name': 'Piano',
+                'channel': i
+            }
+
+            # Buscar nombre del instrumento
+            instruments = _INSTRUMENT_XP(part)
+            instrument = instruments[0] if instruments else None
+            if instrument is not None:
+                long_name = instrument.find('longName')
+                short_name = instrument.find('shortName')
+
+                if long_name is not None and long_name.text:
+                    part_info['name'] = long_name.text
+                elif short_name is not None and short_name.text:
+                    part_info['name'] = short_name.text
+
+            # Buscar información del canal MIDI
+            channels = _CHANNEL_XP(instrument) if instrument is not None else None
+            channel_elem = channels[0] if channels else None
+            if channel_elem is not None:
+                part_info['channel'] = int(channel_elem.get('channel', i))
+
+            metadata['parts'].append(part_info)
+
         except Exception as e:
-            print(f"⚠️  Error extrayendo información de partes: {e}")
+            log.warning("⚠️  Error extrayendo información de partes: %s", e)
     
     def convert_with_smart_pianist_optimization(self, input_file, output_file=None, manual_metadata=None):
         """
         Convierte MSCZ a MIDI optimizado para Smart Pianist con timing preciso
         """
         if not self.musescore_path:
-            print("❌ MuseScore no está disponible")
+            log.error("❌ MuseScore no está disponible")
             return False
         
         if not os.path.exists(input_file):
-            print(f"❌ Archivo no encontrado: {input_file}")
+            log.error("❌ Archivo no encontrado: %s", input_file)
             return False
         
         # Extraer metadatos primero
@@ -236,12 +337,12 @@ class AdvancedMSCZConverter:
         
         # Sobrescribir con metadatos manuales si se proporcionan
         if manual_metadata:
-            print("📝 Aplicando metadatos manuales:")
+            log.info("📝 Aplicando metadatos manuales:")
             for key, value in manual_metadata.items():
                 if key in metadata and value is not None:
                     old_value = metadata[key]
                     metadata[key] = value
-                    print(f"   🔄 {key.title()}: '{old_value}' → '{value}'")
+                    log.info("   🔄 %s: '%s' → '%s'", key.title(), old_value, value)
             
             if not manual_metadata.get('artist') and manual_metadata.get('composer'):
                 metadata['artist'] = manual_metadata['composer']
@@ -262,15 +363,94 @@ class AdvancedMSCZConverter:
             # Paso 2: Post-procesar preservando timing exacto
             self._optimize_for_smart_pianist(output_path, metadata)
             
-            # Paso 3: Analizar el resultado
-            self.analyze_midi_structure(output_path)
+            # Paso 3: Analizar el resultado (solo si se pide salida detallada)
+            self.analyze_midi_structure(output_path, verbose=self.debug_mode)
             
             return True
         
         return False
     
+    def convert_many(self, pairs, manual_metadata=None):
+        """
+        Convierte varios MSCZ en una única invocación de MuseScore usando su
+        modo batch (-j job.json), amortizando el arranque del proceso (Qt,
+        fuentes) entre todos los archivos. `pairs` es una lista de tuplas
+        (entrada_mscz, salida_midi). El post-procesado para Smart Pianist se
+        aplica después a cada MIDI generado.
+        """
+        if not self.musescore_path:
+            log.error("❌ MuseScore no está disponible")
+            return False
+
+        # Normalizar rutas y preparar el trabajo batch
+        norm_pairs = []
+        jobs = []
+        for input_file, output_file in pairs:
+            input_path = Path(input_file)
+            output_path = Path(output_file).with_suffix('.mid')
+            output_path.parent.mkdir(parents=True, exist_ok=True)
+            norm_pairs.append((input_path, output_path))
+            jobs.append({"in": str(input_path), "out": str(output_path)})
+
+        if not jobs:
+            return True
+
+        job_file = None
+        try:
+            with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False,
+                                             encoding='utf-8') as f:
+                json.dump(jobs, f)
+                job_file = f.name
+
+            cmd = [str(self.musescore_path), "-j", job_file, "--force"]
+            log.info("🎹 Convirtiendo %s archivos en un solo proceso...", len(jobs))
+            log.info("📝 Comando: %s", ' '.join(cmd))
+
+            result = subprocess.run(
+                cmd,
+                capture_output=True,
+                text=True,
+                timeout=120 * len(jobs)
+            )
+
+            log.info("📋 Código de salida: %s", result.returncode)
+            if result.stderr:
+                log.warning("⚠️  Stderr: %s", result.stderr)
+
+        except Exception as e:
+            log.error("❌ Error en conversión batch: %s", e)
+            return False
+        finally:
+            if job_file and os.path.exists(job_file):
+                os.unlink(job_file)
+
+        # Post-procesar cada MIDI producido; caer a la ruta de un solo
+        # archivo para los que el batch no haya generado
+        all_ok = True
+        for input_path, output_path in norm_pairs:
+            if not (output_path.exists() and output_path.stat().st_size > 0):
+                log.warning("⚠️  El batch no generó %s, reintentando individualmente...", output_path.name)
+                if not self._convert_basic(input_path, output_path):
+                    all_ok = False
+                    continue
+
+            metadata = self.extract_mscz_metadata(input_path)
+            if manual_metadata:
+                for key, value in manual_metadata.items():
+                    if key in metadata and value is not None:
+                        metadata[key] = value
+            self._optimize_for_smart_pianist(output_path, metadata)
+
+        return all_ok
+
     def _get_musescore_version(self):
-        """Detecta la versión de MuseScore"""
+        """Detecta la versión de MuseScore (se calcula una sola vez)"""
+        if self._ms_version is not None:
+            return self._ms_version
+        self._ms_version = self._detect_musescore_version()
+        return self._ms_version
+
+    def _detect_musescore_version(self):
         try:
             result = subprocess.run([self.musescore_path, "--version"], 
                                   capture_output=True, text=True, timeout=10)
@@ -292,7 +472,7 @@ class AdvancedMSCZConverter:
         """Convierte usando MuseScore con configuraciones específicas para preservar timing"""
         try:
             version = self._get_musescore_version()
-            print(f"🎼 Usando MuseScore versión {version}")
+            log.info("🎼 Usando MuseScore versión %s", version)
             
             # Comando optimizado para preservar estructura
             if version >= 4:
@@ -309,8 +489,8 @@ class AdvancedMSCZConverter:
                     str(input_path)
                 ]
             
-            print(f"🎹 Convirtiendo archivo...")
-            print(f"📝 Comando: {' '.join(cmd)}")
+            log.info("🎹 Convirtiendo archivo...")
+            log.info("📝 Comando: %s", ' '.join(cmd))
             
             output_path.parent.mkdir(parents=True, exist_ok=True)
             
@@ -322,63 +502,92 @@ class AdvancedMSCZConverter:
                 cwd=str(input_path.parent)
             )
             
-            print(f"📋 Código de salida: {result.returncode}")
+            log.info("📋 Código de salida: %s", result.returncode)
             if result.stdout:
-                print(f"📤 Salida: {result.stdout}")
+                log.info("📤 Salida: %s", result.stdout)
             if result.stderr:
-                print(f"⚠️  Stderr: {result.stderr}")
-            
-            time.sleep(2)
-            
+                log.warning("⚠️  Stderr: %s", result.stderr)
+            
+            # subprocess.run ya bloquea hasta que MuseScore termina; solo
+            # sondeamos brevemente por si el sistema de archivos va rezagado.
+            for _ in range(10):
+                if output_path.exists() and output_path.stat().st_size > 0:
+                    break
+                time.sleep(0.05)
+
             if output_path.exists():
                 file_size = output_path.stat().st_size
-                print(f"✅ Archivo generado: {output_path} ({file_size} bytes)")
+                log.info("✅ Archivo generado: %s (%s bytes)", output_path, file_size)
                 return file_size > 0
             else:
-                print(f"❌ No se generó el archivo MIDI")
+                log.error("❌ No se generó el archivo MIDI")
                 return False
                 
         except Exception as e:
-            print(f"❌ Error en conversión: {e}")
+            log.error("❌ Error en conversión: %s", e)
             return False
     
     def _optimize_for_smart_pianist(self, midi_file, metadata):
         """
         Optimiza el MIDI para Smart Pianist preservando el timing exacto
         """
+        original_bytes = None
         try:
-            print("🔧 Optimizando para Smart Pianist (preservando timing)...")
-            
-            # Crear backup
-            backup_file = midi_file.with_suffix('.mid.backup')
-            shutil.copy2(midi_file, backup_file)
-            
+            log.info("🔧 Optimizando para Smart Pianist (preservando timing)...")
+
+            # Guardar el contenido original en memoria como punto de retorno;
+            # un MIDI típico ocupa <200 KB, así evitamos el .backup en disco
+            original_bytes = Path(midi_file).read_bytes()
+
             # Leer archivo original
             original_mid = mido.MidiFile(midi_file)
-            print(f"📊 Archivo original: Tipo {original_mid.type}, {len(original_mid.tracks)} tracks")
-            
-            # Analizar estructura y determinar si necesita separación
-            analysis = self._analyze_track_structure(original_mid)
+            log.info("📊 Archivo original: Tipo %s, %s tracks", original_mid.type, len(original_mid.tracks))
             
-            if analysis['needs_separation']:
-                print("🎯 Separando en canales para Smart Pianist...")
-                new_mid = self._create_separated_midi(original_mid, metadata, analysis)
-            else:
-                print("✅ Estructura ya adecuada, aplicando metadatos...")
+            # Atajo: si un sondeo corto ya ve dos canales (la salida habitual
+            # de MuseScore 4 con partes bien asignadas), no hace falta el
+            # análisis completo del archivo
+            if self._probe_multiple_channels(original_mid):
+                log.info("✅ Varios canales ya presentes, aplicando metadatos...")
                 new_mid = self._enhance_existing_midi(original_mid, metadata)
+            else:
+                # Analizar estructura y determinar si necesita separación
+                analysis = self._analyze_track_structure(original_mid)
+
+                if analysis['needs_separation']:
+                    log.info("🎯 Separando en canales para Smart Pianist...")
+                    new_mid = self._create_separated_midi(original_mid, metadata, analysis)
+                else:
+                    log.info("✅ Estructura ya adecuada, aplicando metadatos...")
+                    new_mid = self._enhance_existing_midi(original_mid, metadata)
             
             # Guardar archivo optimizado
             new_mid.save(midi_file)
-            print("✅ Optimización completada")
+            log.info("✅ Optimización completada")
             
         except Exception as e:
-            print(f"❌ Error en optimización: {e}")
-            # Restaurar backup
-            if backup_file.exists():
-                shutil.copy2(backup_file, midi_file)
+            log.error("❌ Error en optimización: %s", e)
+            # Restaurar el contenido original
+            if original_bytes is not None:
+                Path(midi_file).write_bytes(original_bytes)
             import traceback
             traceback.print_exc()
     
+    def _probe_multiple_channels(self, midi_file, limit=500):
+        """
+        Sondeo barato: mira como mucho `limit` mensajes por pista y responde
+        si ya hay notas en al menos dos canales MIDI distintos
+        """
+        channels = set()
+        for track in midi_file.tracks:
+            for i, msg in enumerate(track):
+                if i >= limit:
+                    break
+                if msg.type == 'note_on' and msg.velocity > 0:
+                    channels.add(msg.channel)
+                    if len(channels) >= 2:
+                        return True
+        return False
+
     def _analyze_track_structure(self, midi_file):
         """
         Analiza la estructura del MIDI para determinar la mejor estrategia
@@ -392,75 +601,50 @@ class AdvancedMSCZConverter:
             'split_point': 60
         }
         
+        # Recoger las notas en bruto; el histograma y el rango se calculan
+        # después con el kernel compilado _hist_and_range
         all_notes = []
-        
+
         for track_idx, track in enumerate(midi_file.tracks):
             has_notes = False
-            track_channels = set()
-            
+
             for msg in track:
                 if msg.type == 'note_on' and msg.velocity > 0:
                     has_notes = True
-                    track_channels.add(msg.channel)
                     analysis['channels_used'].add(msg.channel)
                     all_notes.append(msg.note)
-                    
-                    # Contar distribución aproximada
-                    if msg.note < 60:
-                        analysis['note_distribution']['low'] += 1
-                    else:
-                        analysis['note_distribution']['high'] += 1
-            
+
             if has_notes:
                 analysis['musical_tracks'] += 1
-        
+
+        notes_arr = np.asarray(all_notes, dtype=np.int32)
+        note_counts, min_note, max_note = _hist_and_range(notes_arr)
+
+        # Contar distribución aproximada
+        low = int(note_counts[:60].sum())
+        analysis['note_distribution']['low'] = low
+        analysis['note_distribution']['high'] = len(all_notes) - low
+
         # Determinar si necesita separación
         # Criterios: un solo canal usado Y distribución de notas balanceada
-        if (len(analysis['channels_used']) <= 1 and 
-            analysis['note_distribution']['low'] > 5 and 
+        if (len(analysis['channels_used']) <= 1 and
+            analysis['note_distribution']['low'] > 5 and
             analysis['note_distribution']['high'] > 5):
             analysis['needs_separation'] = True
-            analysis['split_point'] = self._calculate_optimal_split(all_notes)
+            analysis['split_point'] = self._calculate_optimal_split(note_counts, min_note, max_note)
         
-        print(f"📈 Análisis: {analysis['musical_tracks']} tracks musicales, "
-              f"canales {sorted(analysis['channels_used'])}")
+        log.info("📈 Análisis: %s tracks musicales, canales %s",
+                 analysis['musical_tracks'], sorted(analysis['channels_used']))
         
         return analysis
     
-    def _calculate_optimal_split(self, all_notes):
+    def _calculate_optimal_split(self, note_counts, min_note, max_note):
         """
-        Calcula el punto óptimo de separación basado en la distribución real de notas
+        Calcula el punto óptimo de separación a partir del histograma de notas
+        construido durante el análisis de pistas
         """
-        if not all_notes:
-            return 60
-        
-        # Crear histograma de frecuencias
-        note_counts = defaultdict(int)
-        for note in all_notes:
-            note_counts[note] += 1
-        
-        # Buscar el "valle" más profundo en el rango medio
-        min_note = min(all_notes)
-        max_note = max(all_notes)
-        
-        # Limitar búsqueda al rango razonable para piano
-        search_start = max(48, min_note)  # Do3
-        search_end = min(72, max_note)    # Do5
-        
-        best_split = 60
-        min_density = float('inf')
-        
-        for split_candidate in range(search_start, search_end + 1):
-            # Calcular densidad de notas alrededor de este punto
-            density = 0
-            for note in range(split_candidate - 2, split_candidate + 3):
-                density += note_counts.get(note, 0)
-            
-            if density < min_density:
-                min_density = density
-                best_split = split_candidate
-        
-        print(f"🎯 Punto de separación optimizado: {best_split} (MIDI note)")
+        best_split = int(_best_split(note_counts, min_note, max_note))
+        log.info("🎯 Punto de separación optimizado: %s (MIDI note)", best_split)
         return best_split
     
     def _create_separated_midi(self, original_mid, metadata, analysis):
@@ -478,20 +662,31 @@ class AdvancedMSCZConverter:
         self._add_metadata_track(meta_track, metadata)
         new_mid.tracks.append(meta_track)
         
-        # Combinar todos los eventos musicales con timing absoluto
-        combined_events = []
-        current_time = 0
-        
-        for track in original_mid.tracks:
-            track_time = 0
-            for msg in track:
-                track_time += msg.time
-                if msg.type in ['note_on', 'note_off', 'control_change', 'program_change']:
-                    combined_events.append((track_time, msg))
-        
-        # Ordenar eventos por tiempo
-        combined_events.sort(key=lambda x: x[0])
-        
+        # Extraer todos los eventos musicales a buffers paralelos (SoA):
+        # tiempo absoluto, código de tipo y los dos bytes de datos MIDI.
+        # mido.merge_tracks mezcla las pistas (ya ordenadas) en una sola
+        # pasada O(N), así que los buffers se llenan directamente en orden
+        # temporal y no hace falta ordenar después.
+        times, type_codes, data1, data2 = [], [], [], []
+        abs_t = 0
+
+        for msg in mido.merge_tracks(original_mid.tracks):
+            abs_t += msg.time
+            code = _EV_TYPE_CODES.get(msg.type)
+            if code is None:
+                continue
+            times.append(abs_t)
+            type_codes.append(code)
+            if code <= _EV_NOTE_OFF:
+                data1.append(msg.note)
+                data2.append(msg.velocity)
+            elif code == _EV_CONTROL:
+                data1.append(msg.control)
+                data2.append(msg.value)
+            else:
+                data1.append(msg.program)
+                data2.append(0)
+
         # Crear tracks separados
         right_hand_track = mido.MidiTrack()
         left_hand_track = mido.MidiTrack()
@@ -508,44 +703,57 @@ class AdvancedMSCZConverter:
         right_last_time = 0
         left_last_time = 0
         
-        # Procesar eventos preservando timing relativo
-        for abs_time, msg in combined_events:
-            if msg.type in ['note_on', 'note_off']:
+        # Procesar eventos preservando timing relativo; solo aquí se vuelven
+        # a construir objetos mido.Message, uno por evento emitido.
+        # Todo lo que toca el bucle se liga a locales: en CPython la carga de
+        # una local es mucho más barata que un lookup de global/atributo.
+        split_point = analysis['split_point']
+        right_append = right_hand_track.append
+        left_append = left_hand_track.append
+        message = mido.Message
+        ev_note_on = _EV_NOTE_ON
+        ev_note_off = _EV_NOTE_OFF
+        ev_control = _EV_CONTROL
+
+        # Último valor emitido por controlador, para colapsar CCs redundantes
+        # (MuseScore vuelca pedal/expresión muy densos con valores repetidos)
+        last_cc_value = {}
+
+        def _emit_both(msg_type, abs_time, **data):
+            # Duplicar controles para ambas manos
+            nonlocal right_last_time, left_last_time
+            right_append(message(
+                msg_type, time=abs_time - right_last_time, channel=0, **data))
+            right_last_time = abs_time
+            left_append(message(
+                msg_type, time=abs_time - left_last_time, channel=1, **data))
+            left_last_time = abs_time
+
+        for abs_time, code, d1, d2 in zip(times, type_codes, data1, data2):
+            if code <= ev_note_off:
+                msg_type = 'note_on' if code == ev_note_on else 'note_off'
                 # Determinar mano basado en nota
-                if msg.note >= analysis['split_point']:
+                if d1 >= split_point:
                     # Mano derecha (canal 0)
-                    delta_time = abs_time - right_last_time
-                    new_msg = msg.copy()
-                    new_msg.channel = 0
-                    new_msg.time = delta_time
-                    right_hand_track.append(new_msg)
+                    right_append(message(
+                        msg_type, note=d1, velocity=d2,
+                        time=abs_time - right_last_time, channel=0))
                     right_last_time = abs_time
                 else:
                     # Mano izquierda (canal 1)
-                    delta_time = abs_time - left_last_time
-                    new_msg = msg.copy()
-                    new_msg.channel = 1
-                    new_msg.time = delta_time
-                    left_hand_track.append(new_msg)
+                    left_append(message(
+                        msg_type, note=d1, velocity=d2,
+                        time=abs_time - left_last_time, channel=1))
                     left_last_time = abs_time
-            
-            elif msg.type in ['control_change', 'program_change']:
-                # Duplicar controles para ambas manos
-                # Mano derecha
-                delta_time_r = abs_time - right_last_time
-                msg_r = msg.copy()
-                msg_r.channel = 0
-                msg_r.time = delta_time_r
-                right_hand_track.append(msg_r)
-                right_last_time = abs_time
-                
-                # Mano izquierda
-                delta_time_l = abs_time - left_last_time
-                msg_l = msg.copy()
-                msg_l.channel = 1
-                msg_l.time = delta_time_l
-                left_hand_track.append(msg_l)
-                left_last_time = abs_time
+
+            elif code == ev_control:
+                if last_cc_value.get(d1) == d2:
+                    continue
+                last_cc_value[d1] = d2
+                _emit_both('control_change', abs_time, control=d1, value=d2)
+
+            else:
+                _emit_both('program_change', abs_time, program=d1)
         
         # Agregar tracks al archivo final
         new_mid.tracks.append(right_hand_track)
@@ -557,26 +765,23 @@ class AdvancedMSCZConverter:
         """
         Mejora un MIDI existente que ya tiene la estructura correcta
         """
-        # Crear copia mejorada
         new_mid = mido.MidiFile(
             ticks_per_beat=original_mid.ticks_per_beat,
             type=original_mid.type
         )
-        
-        # Procesar cada track
-        for i, track in enumerate(original_mid.tracks):
-            new_track = mido.MidiTrack()
-            
-            # Si es el primer track, agregar metadatos
-            if i == 0:
-                self._add_metadata_track(new_track, metadata)
-            
-            # Copiar mensajes existentes
-            for msg in track:
-                new_track.append(msg.copy())
-            
-            new_mid.tracks.append(new_track)
-        
+
+        # Anteponer los metadatos al primer track y reutilizar el resto por
+        # referencia: los bytes escritos son idénticos y nos ahorramos un
+        # msg.copy() por cada mensaje del archivo
+        meta_track = mido.MidiTrack()
+        self._add_metadata_track(meta_track, metadata)
+
+        if original_mid.tracks:
+            meta_track.extend(original_mid.tracks[0])
+            new_mid.tracks = [meta_track] + list(original_mid.tracks[1:])
+        else:
+            new_mid.tracks = [meta_track]
+
         return new_mid
     
     def _add_metadata_track(self, track, metadata):
@@ -614,28 +819,31 @@ class AdvancedMSCZConverter:
         if metadata.get('key_signature') is not None:
             track.append(mido.MetaMessage('key_signature', key=metadata['key_signature'], time=0))
     
-    def analyze_midi_structure(self, midi_file):
-        """Analiza la estructura del archivo MIDI generado"""
+    def analyze_midi_structure(self, midi_file, verbose=False):
+        """Analiza la estructura del archivo MIDI generado (solo con verbose)"""
+        if not verbose:
+            return True
+
         try:
-            print(f"\n🔍 Análisis final: {Path(midi_file).name}")
-            
+            log.info("\n🔍 Análisis final: %s", Path(midi_file).name)
+
             mid = mido.MidiFile(midi_file)
-            
-            print(f"📊 Información general:")
-            print(f"   Tipo: {mid.type}")
-            print(f"   Ticks por beat: {mid.ticks_per_beat}")
-            print(f"   Duración: {mid.length:.2f} segundos")
-            print(f"   Tracks: {len(mid.tracks)}")
-            
+
+            log.info("📊 Información general:")
+            log.info("   Tipo: %s", mid.type)
+            log.info("   Ticks por beat: %s", mid.ticks_per_beat)
+            log.info("   Duración: %.2f segundos", mid.length)
+            log.info("   Tracks: %s", len(mid.tracks))
+
             total_notes = 0
             channels_used = set()
-            
+
             for i, track in enumerate(mid.tracks):
-                track_name = f"Track {i}"
+                track_name = None
                 note_count = 0
                 track_channels = set()
-                note_range = {'min': 127, 'max': 0}
-                
+                note_min, note_max = 127, 0
+
                 for msg in track:
                     if msg.type == 'track_name':
                         track_name = msg.name
@@ -644,35 +852,50 @@ class AdvancedMSCZConverter:
                         total_notes += 1
                         track_channels.add(msg.channel)
                         channels_used.add(msg.channel)
-                        note_range['min'] = min(note_range['min'], msg.note)
-                        note_range['max'] = max(note_range['max'], msg.note)
-                
-                if note_count > 0 or any(msg.type == 'track_name' for msg in track):
-                    print(f"\n🎼 {track_name}:")
-                    print(f"   Notas: {note_count}")
+                        if msg.note < note_min:
+                            note_min = msg.note
+                        if msg.note > note_max:
+                            note_max = msg.note
+
+                if note_count > 0 or track_name is not None:
+                    log.info("\n🎼 %s:", track_name or f'Track {i}')
+                    log.info("   Notas: %s", note_count)
                     if track_channels:
-                        print(f"   Canales MIDI: {sorted(track_channels)}")
-                    if note_range['min'] <= note_range['max']:
-                        print(f"   Rango: {note_range['min']}-{note_range['max']}")
+                        log.info("   Canales MIDI: %s", sorted(track_channels))
+                    if note_min <= note_max:
+                        log.info("   Rango: %s-%s", note_min, note_max)
             
-            print(f"\n📈 Resumen:")
-            print(f"   Total de notas: {total_notes}")
-            print(f"   Canales MIDI usados: {sorted(channels_used)}")
+            log.info("\n📈 Resumen:")
+            log.info("   Total de notas: %s", total_notes)
+            log.info("   Canales MIDI usados: %s", sorted(channels_used))
             
             # Verificación para Smart Pianist
             if len(channels_used) >= 2:
-                print("✅ MÚLTIPLES CANALES DETECTADOS - ¡Perfecto para Smart Pianist!")
-                print("   👍 Las manos deberían separarse correctamente")
+                log.info("✅ MÚLTIPLES CANALES DETECTADOS - ¡Perfecto para Smart Pianist!")
+                log.info("   👍 Las manos deberían separarse correctamente")
             else:
-                print("⚠️  Un solo canal detectado - Smart Pianist puede no separar las manos")
+                log.warning("⚠️  Un solo canal detectado - Smart Pianist puede no separar las manos")
             
             return True
             
         except Exception as e:
-            print(f"❌ Error en análisis: {e}")
+            log.error("❌ Error en análisis: %s", e)
             return False
 
 
+# Conversor compartido por las funciones de conveniencia: la resolución del
+# ejecutable y la versión de MuseScore se pagan una sola vez por proceso
+_default_converter = None
+
+
+def get_converter():
+    """Devuelve el AdvancedMSCZConverter compartido del módulo (lazy)"""
+    global _default_converter
+    if _default_converter is None:
+        _default_converter = AdvancedMSCZConverter()
+    return _default_converter
+
+
 # Función de conveniencia mejorada
 def convert_mscz_for_smart_pianist(mscz_file, output_file=None, manual_metadata=None):
     """
@@ -684,13 +907,13 @@ def convert_mscz_for_smart_pianist(mscz_file, output_file=None, manual_metadata=
         output_file: Ruta de salida MIDI (opcional)
         manual_metadata: Dict con metadatos para sobrescribir
     """
-    converter = AdvancedMSCZConverter()
-    
+    converter = get_converter()
+
     if not converter.musescore_path:
-        print("❌ MuseScore no encontrado. Instálalo desde: https://musescore.org")
+        log.error("❌ MuseScore no encontrado. Instálalo desde: https://musescore.org")
         return False
     
-    print(f"✅ MuseScore encontrado: {converter.musescore_path}")
+    log.info("✅ MuseScore encontrado: %s", converter.musescore_path)
     return converter.convert_with_smart_pianist_optimization(mscz_file, output_file, manual_metadata)
 
 
@@ -699,33 +922,33 @@ def fix_existing_midi_for_smart_pianist(midi_file, split_note=60):
     """
     Arregla un archivo MIDI existente para Smart Pianist sin re-convertir
     """
-    converter = AdvancedMSCZConverter()
-    
+    converter = get_converter()
+
+    original_bytes = None
     try:
-        print(f"🔧 Arreglando MIDI existente: {Path(midi_file).name}")
-        
-        # Crear backup
-        backup_file = Path(midi_file).with_suffix('.mid.backup')
-        shutil.copy2(midi_file, backup_file)
-        
+        log.info("🔧 Arreglando MIDI existente: %s", Path(midi_file).name)
+
+        # Guardar el contenido original en memoria como punto de retorno
+        original_bytes = Path(midi_file).read_bytes()
+
         # Leer archivo
         mid = mido.MidiFile(midi_file)
         analysis = converter._analyze_track_structure(mid)
         
         if analysis['needs_separation']:
-            print(f"🎯 Separando canales en nota {split_note}")
+            log.info("🎯 Separando canales en nota %s", split_note)
             # Usar split_note personalizado
             analysis['split_point'] = split_note
             new_mid = converter._create_separated_midi(mid, {}, analysis)
             new_mid.save(midi_file)
-            print("✅ MIDI arreglado")
+            log.info("✅ MIDI arreglado")
             return True
         else:
-            print("✅ El MIDI ya tiene estructura adecuada")
+            log.info("✅ El MIDI ya tiene estructura adecuada")
             return True
             
     except Exception as e:
-        print(f"❌ Error arreglando MIDI: {e}")
-        if backup_file.exists():
-            shutil.copy2(backup_file, midi_file)
+        log.error("❌ Error arreglando MIDI: %s", e)
+        if original_bytes is not None:
+            Path(midi_file).write_bytes(original_bytes)
         return False
\ No newline at end of file
@@ -1,10 +1,11 @@
 import os
+import json
 import zipfile
 import xml.etree.ElementTree as ET
 import mido
 from pathlib import Path
 import subprocess
-import shutil
+import tempfile
 
 # La clase MuseScoreConverter es correcta y la mantenemos como está.
 class MuseScoreConverter:
@@ -19,23 +20,54 @@ class MuseScoreConverter:
             raise FileNotFoundError(f"No se encontró el ejecutable de MuseScore en: {self.mscore_path}")
         print(f"✅ Convertidor vía MuseScore inicializado (usando {self.mscore_path.name}).")
 
+    def _run(self, command):
+        si = None
+        if os.name == 'nt':
+            si = subprocess.STARTUPINFO()
+            si.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+            si.wShowWindow = subprocess.SW_HIDE
+        subprocess.run(command, check=True, capture_output=True, text=True, startupinfo=si)
+
     def convert(self, input_file, output_midi_file):
         command = [str(self.mscore_path), '-o', str(output_midi_file), str(input_file)]
         print(f"   - Ejecutando: {' '.join(command)}")
         try:
-            si = None
-            if os.name == 'nt':
-                si = subprocess.STARTUPINFO()
-                si.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-                si.wShowWindow = subprocess.SW_HIDE
-            subprocess.run(command, check=True, capture_output=True, text=True, startupinfo=si)
+            self._run(command)
             print(f"   - Conversión de '{Path(input_file).name}' a MIDI completada.")
             return True
         except subprocess.CalledProcessError as e:
             print(f"❌ ERROR: MuseScore devolvió un error durante la conversión de {Path(input_file).name}.")
             print(f"   Salida de error (stderr): {e.stderr.strip()}")
             return False
-        return False
+
+    def convert_batch(self, pairs):
+        """
+        Convierte varios archivos en una sola invocación de MuseScore usando
+        su modo batch (-j job.json): el arranque (Qt, fuentes, plugins) se
+        paga una vez en lugar de una por archivo. `pairs` es una lista de
+        tuplas (entrada, salida).
+        """
+        if not pairs:
+            return True
+        jobs = [{"in": str(src), "out": str(dst)} for src, dst in pairs]
+        job_file = None
+        try:
+            with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False,
+                                             encoding='utf-8') as f:
+                json.dump(jobs, f)
+                job_file = f.name
+            command = [str(self.mscore_path), '-j', job_file]
+            print(f"   - Ejecutando batch de {len(jobs)} conversiones: {' '.join(command)}")
+            self._run(command)
+            print(f"   - Conversión batch de {len(jobs)} archivos completada.")
+            return True
+        except subprocess.CalledProcessError as e:
+            print("❌ ERROR: MuseScore devolvió un error durante la conversión batch.")
+            print(f"   Salida de error (stderr): {e.stderr.strip()}")
+            return False
+        finally:
+            if job_file and os.path.exists(job_file):
+                os.unlink(job_file)
 
 # ===== CLASE PRINCIPAL REESCRITA CON EL NUEVO ENFOQUE =====
 class YamahaCSPConverter:
@@ -61,60 +93,25 @@ class YamahaCSPConverter:
         else:
             output_path = Path(output_file)
 
-        # Usar un directorio temporal para el MIDI intermedio
-        safe_stem = input_path.stem.replace(' ', '_').replace('.', '_')
-        temp_dir = input_path.parent / f"_temp_{safe_stem}"
-        
+        # Directorio temporal gestionado por el sistema para el MIDI
+        # intermedio: en Linux suele vivir en tmpfs (RAM, sin tocar disco) y
+        # la limpieza está garantizada incluso ante errores
         try:
-            if temp_dir.exists(): shutil.rmtree(temp_dir)
-            temp_dir.mkdir()
-            
-            # Paso 1: Convertir el .mscz original a un MIDI completo (este paso es fiable)
-            print("\n[Paso 1 de 2] Convirtiendo partitura completa a MIDI...")
-            full_midi_path = temp_dir / "full_score.mid"
-            if not self.mscore_converter.convert(input_path, full_midi_path):
-                print("❌ Fallo en la conversión inicial. No se puede continuar.")
-                return False
-
-            # Paso 2: Dividir el MIDI resultante y re-ensamblarlo con canales separados
-            print("\n[Paso 2 de 2] Re-ensamblando MIDI con canales por mano...")
-            source_mid = mido.MidiFile(full_midi_path)
-            
-            # Un MIDI tipo 1 tiene la pista 0 para metadatos, y luego una pista por cada pentagrama.
-            # Asumimos que la pista 1 es la mano derecha y la pista 2 es la mano izquierda.
-            note_tracks = [track for track in source_mid.tracks if any(msg.type.startswith('note') for msg in track)]
-            
-            if len(note_tracks) < 2:
-                print(f"❌ El MIDI resultante no tiene al menos dos pistas de notas para separar. Pistas encontradas: {len(note_tracks)}.")
-                return False
-
-            final_mid = mido.MidiFile(type=1, ticks_per_beat=source_mid.ticks_per_beat)
-
-            # Procesar Pista Mano Derecha (Canal 0)
-            track_rh = mido.MidiTrack()
-            track_rh.append(mido.MetaMessage('track_name', name='Mano Derecha', time=0))
-            track_rh.append(mido.Message('program_change', channel=0, program=0, time=0))
-            for msg in note_tracks[0]: # Primera pista de notas
-                if not msg.is_meta:
-                    track_rh.append(msg.copy(channel=0))
-                else:
-                    track_rh.append(msg)
-            final_mid.tracks.append(track_rh)
-            print("   - Pista de mano derecha (Pista 1 del MIDI) asignada al canal 0.")
-
-            # Procesar Pista Mano Izquierda (Canal 1)
-            track_lh = mido.MidiTrack()
-            track_lh.append(mido.MetaMessage('track_name', name='Mano Izquierda', time=0))
-            track_lh.append(mido.Message('program_change', channel=1, program=0, time=0))
-            for msg in note_tracks[1]: # Segunda pista de notas
-                if not msg.is_meta:
-                    track_lh.append(msg.copy(channel=1))
-                else:
-                    track_lh.append(msg)
-            final_mid.tracks.append(track_lh)
-            print("   - Pista de mano izquierda (Pista 2 del MIDI) asignada al canal 1.")
-
-            final_mid.save(str(output_path))
+            with tempfile.TemporaryDirectory(prefix='yamaha_csp_') as td:
+                temp_dir = Path(td)
+
+                # Paso 1: Convertir el .mscz original a un MIDI completo (este paso es fiable)
+                print("\n[Paso 1 de 2] Convirtiendo partitura completa a MIDI...")
+                full_midi_path = temp_dir / "full_score.mid"
+                if not self.mscore_converter.convert(input_path, full_midi_path):
+                    print("❌ Fallo en la conversión inicial. No se puede continuar.")
+                    return False
+
+                # Paso 2: Dividir el MIDI resultante y re-ensamblarlo con canales separados
+                print("\n[Paso 2 de 2] Re-ensamblando MIDI con canales por mano...")
+                if not self._reassemble_midi(full_midi_path, output_path):
+                    return False
+
             print(f"\n🎉 ¡Proceso completado! Archivo final guardado en: {output_path}")
             return True
 
@@ -123,13 +120,90 @@ class YamahaCSPConverter:
             import traceback
             traceback.print_exc()
             return False
-        
-        finally:
-            # Limpieza: se ejecuta siempre
-            if temp_dir.exists():
-                print("\n[Limpieza] Eliminando directorio temporal...")
-                shutil.rmtree(temp_dir)
-                print("   - Directorio temporal eliminado.")
+
+    def convert_many(self, mscz_files):
+        """
+        Convierte una lista de MSCZ con UNA sola invocación de MuseScore
+        (modo batch) y después re-ensambla cada MIDI con un canal por mano.
+        Devuelve un dict {entrada: bool} con el resultado por archivo.
+        """
+        results = {}
+        if not mscz_files:
+            return results
+
+        with tempfile.TemporaryDirectory(prefix='yamaha_csp_batch_') as td:
+            temp_dir = Path(td)
+
+            # Preparar (entrada, midi intermedio, salida final) por archivo
+            triples = []
+            for i, mscz_file in enumerate(mscz_files):
+                input_path = Path(mscz_file)
+                output_path = input_path.with_suffix('.mid')
+                full_midi_path = temp_dir / f"full_score_{i:04d}.mid"
+                triples.append((input_path, full_midi_path, output_path))
+
+            print(f"\n[Paso 1 de 2] Convirtiendo {len(triples)} partituras a MIDI (batch)...")
+            self.mscore_converter.convert_batch(
+                [(src, mid) for src, mid, _ in triples])
+
+            print("\n[Paso 2 de 2] Re-ensamblando cada MIDI con canales por mano...")
+            for input_path, full_midi_path, output_path in triples:
+                if not full_midi_path.exists():
+                    print(f"❌ El batch no generó el MIDI de '{input_path.name}'.")
+                    results[str(input_path)] = False
+                    continue
+                ok = self._reassemble_midi(full_midi_path, output_path)
+                if ok:
+                    print(f"🎉 '{input_path.name}' → {output_path}")
+                results[str(input_path)] = ok
+
+        return results
+
+    def _reassemble_midi(self, full_midi_path, output_path):
+        """Divide un MIDI completo en canales por mano y lo guarda en output_path"""
+        source_mid = mido.MidiFile(full_midi_path)
+
+        # Un MIDI tipo 1 tiene la pista 0 para metadatos, y luego una pista por cada pentagrama.
+        # Asumimos que la pista 1 es la mano derecha y la pista 2 es la mano izquierda.
+        note_tracks = [track for track in source_mid.tracks if any(msg.type.startswith('note') for msg in track)]
+
+        if len(note_tracks) < 2:
+            print(f"❌ El MIDI resultante no tiene al menos dos pistas de notas para separar. Pistas encontradas: {len(note_tracks)}.")
+            return False
+
+        final_mid = mido.MidiFile(type=1, ticks_per_beat=source_mid.ticks_per_beat)
+
+        # Las pistas vienen de un MidiFile recién cargado que nadie más
+        # comparte, así que se puede reasignar msg.channel in place y volcar
+        # la pista entera con extend, sin un msg.copy() por evento
+
+        # Procesar Pista Mano Derecha (Canal 0)
+        track_rh = mido.MidiTrack()
+        track_rh.append(mido.MetaMessage('track_name', name='Mano Derecha', time=0))
+        track_rh.append(mido.Message('program_change', channel=0, program=0, time=0))
+        for msg in note_tracks[0]: # Primera pista de notas
+            if not msg.is_meta:
+                msg.channel = 0
+        track_rh.extend(note_tracks[0])
+        final_mid.tracks.append(track_rh)
+        print("   - Pista de mano derecha (Pista 1 del MIDI) asignada al canal 0.")
+
+        # Procesar Pista Mano Izquierda (Canal 1)
+        track_lh = mido.MidiTrack()
+        track_lh.append(mido.MetaMessage('track_name', name='Mano Izquierda', time=0))
+        track_lh.append(mido.Message('program_change', channel=1, program=0, time=0))
+        for msg in note_tracks[1]: # Segunda pista de notas
+            if not msg.is_meta:
+                msg.channel = 1
+        track_lh.extend(note_tracks[1])
+        final_mid.tracks.append(track_lh)
+        print("   - Pista de mano izquierda (Pista 2 del MIDI) asignada al canal 1.")
+
+        # Escritura con un buffer grande: mido serializa el archivo en
+        # escrituras pequeñas y así se agrupan en pocas llamadas al sistema
+        with open(output_path, 'wb', buffering=1 << 20) as f:
+            final_mid.save(file=f)
+        return True
 
 # --- EJEMPLO DE USO (sin cambios) ---
 if __name__ == '__main__':
@@ -1,9 +1,179 @@
 import os
+import io
+import functools
+import heapq
+import logging
+import sys
 import zipfile
 import xml.etree.ElementTree as ET
 import mido
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
+# Logger del módulo: los mensajes se formatean de forma diferida (argumentos
+# %-style), así que las trazas de depuración no cuestan nada si el nivel
+# DEBUG está desactivado
+log = logging.getLogger(__name__)
+
+
+# Duraciones expresadas como fracción de la negra; el mapa en ticks se deriva
+# una sola vez por pentagrama a partir del <Division> de la partitura.
+# 'measure' y 'breve' mantienen el convenio del código original (dos negras).
+_DURATION_FRACTIONS = {
+    'whole': 4, 'half': 2, 'quarter': 1, 'black': 1,
+    'eighth': 0.5, '16th': 0.25, '32nd': 0.125, '64th': 0.0625,
+    'measure': 2, 'breve': 2,
+}
+# Claves internadas: si el texto del <durationType> también se interna al
+# leerlo, la búsqueda en el mapa se resuelve comparando punteros en lugar
+# de comparar los caracteres de la cadena
+_DURATION_FRACTIONS = {sys.intern(k): v for k, v in _DURATION_FRACTIONS.items()}
+
+# Etiquetas literales (sin sintaxis XPath): ElementTree usa su rama rápida
+# de comparación directa de tag y, con iterfind, no materializa listas
+_MEASURE = 'Measure'
+_VOICE = 'voice'
+
+# Clase de evento en los buffers SoA: ints pequeños en lugar de strings,
+# así la comparación en los bucles calientes es aritmética pura
+_NOTE_ON = 0
+_NOTE_OFF = 1
+
+# Tablas indexadas por la clase del evento: el tipo y la velocidad salen
+# con una indexación directa, sin condicionales en el bucle de emisión
+_TYPE = ('note_on', 'note_off')
+_VEL = (90, 0)
+
+
+@functools.lru_cache(maxsize=None)
+def _find_mscx(zip_path, mtime_ns, size):
+    """
+    Localiza la entrada .mscx dentro del MSCZ y la memoiza por
+    (ruta, mtime, tamaño), de modo que conversiones repetidas del mismo
+    archivo no vuelvan a recorrer el directorio central del zip. Devuelve
+    el ZipInfo, que zip_ref.open() acepta directamente.
+    """
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        for info in zip_ref.infolist():
+            if info.filename.endswith('.mscx'):
+                return info
+    return None
+
+def _extract_staff_events(staff_node, ticks_per_quarter):
+    """
+    Extrae los eventos de nota de un <Staff> como buffers paralelos
+    (tick, clase, tono), YA ordenados por tick. Es una función de módulo
+    (picklable) para poder ejecutarla también en procesos hijo.
+    """
+    # Buffers paralelos (SoA): tick, clase (_NOTE_ON/_NOTE_OFF) y tono.
+    # Los note_on se emiten en el momento del acorde (el cursor avanza de
+    # forma monótona) y los note_off esperan en un montículo hasta que el
+    # cursor los alcanza, así que los buffers salen ordenados y no hace
+    # falta ordenarlos después. Solo las ligaduras retienen su note_off
+    # hasta conocerse la duración total.
+    ticks = []
+    kinds = []
+    pitches = []
+    current_tick = 0
+    # Mapa de duraciones en ticks, derivado una vez por pentagrama de las
+    # fracciones a nivel de módulo
+    duration_map = {k: int(ticks_per_quarter * v) for k, v in _DURATION_FRACTIONS.items()}
+    open_ties = {}
+    pending_offs = []  # montículo (tick, nº de orden, tono)
+    off_seq = 0
+    _intern = sys.intern
+
+    def _flush_offs(upto):
+        # Vuelca los note_off pendientes que el cursor ya ha alcanzado
+        while pending_offs and pending_offs[0][0] <= upto:
+            off_tick, _, off_pitch = heapq.heappop(pending_offs)
+            ticks.append(off_tick); kinds.append(_NOTE_OFF); pitches.append(off_pitch)
+
+    for measure in staff_node.iterfind(_MEASURE):
+        for voice in measure.iterfind(_VOICE):
+            for element in voice:
+                # Una única pasada por los hijos en lugar de un find()
+                # por etiqueta (cada find construye su propio parser)
+                duration_type = None
+                dotted = False
+                chord_notes = []
+                for child in element:
+                    tag = child.tag
+                    if tag == 'durationType':
+                        # Internada: las claves del mapa también lo están,
+                        # así que el get() de abajo compara por identidad
+                        duration_type = _intern(child.text) if child.text else None
+                    elif tag == 'dots':
+                        dotted = True
+                    elif tag == 'Note':
+                        chord_notes.append(child)
+                if duration_type is None: continue
+                base_duration = duration_map.get(duration_type, 0)
+                if dotted:
+                    base_duration = int(base_duration * 1.5)
+                if element.tag == 'Chord':
+                    _flush_offs(current_tick)
+                    for note_node in chord_notes:
+                        # Tono y ligaduras en la misma pasada por los
+                        # hijos del <Note>; su esquema es fijo y plano
+                        pitch_text = None
+                        is_tied_from_prev = False
+                        is_tied_to_next = False
+                        for child in note_node:
+                            tag = child.tag
+                            if tag == 'pitch':
+                                pitch_text = child.text
+                            elif tag == 'Spanner':
+                                for sub in child:
+                                    if sub.tag == 'prev':
+                                        is_tied_from_prev = True
+                                    elif sub.tag == 'next':
+                                        is_tied_to_next = True
+                        if pitch_text is None: continue
+                        pitch = int(pitch_text)
+                        if is_tied_from_prev:
+                            if pitch in open_ties:
+                                start_tick, total = open_ties[pitch]
+                                if is_tied_to_next:
+                                    open_ties[pitch] = (start_tick, total + base_duration)
+                                else:
+                                    # Se cierra la ligadura: ya se conoce la
+                                    # duración total y el note_off puede
+                                    # esperar en el montículo
+                                    del open_ties[pitch]
+                                    heapq.heappush(pending_offs,
+                                                   (start_tick + total + base_duration, off_seq, pitch))
+                                    off_seq += 1
+                        else:
+                            if is_tied_to_next:
+                                open_ties[pitch] = (current_tick, base_duration)
+                                ticks.append(current_tick); kinds.append(_NOTE_ON); pitches.append(pitch)
+                            else:
+                                ticks.append(current_tick); kinds.append(_NOTE_ON); pitches.append(pitch)
+                                heapq.heappush(pending_offs,
+                                               (current_tick + base_duration, off_seq, pitch))
+                                off_seq += 1
+                    current_tick += base_duration
+                elif element.tag == 'Rest':
+                    current_tick += base_duration
+
+    # Ligaduras sin cerrar (partitura malformada): se apaga la nota con lo
+    # acumulado para no dejar un note_on colgando
+    for pitch, (start_tick, total) in open_ties.items():
+        heapq.heappush(pending_offs, (start_tick + total, off_seq, pitch))
+        off_seq += 1
+    _flush_offs(float('inf'))
+    return (np.asarray(ticks, dtype=np.int64),
+            np.asarray(kinds, dtype=np.uint8),
+            np.asarray(pitches, dtype=np.uint8))
+
+
+def _parse_staff_bytes(staff_bytes, ticks_per_quarter):
+    """Re-parsea un <Staff> serializado y extrae sus eventos (para procesos hijo)"""
+    return _extract_staff_events(ET.fromstring(staff_bytes), ticks_per_quarter)
+
+
 class DirectXMLtoMIDIConverter:
     """
     Versión final que interpreta correctamente las ligaduras y la armadura.
@@ -11,7 +181,7 @@ class DirectXMLtoMIDIConverter:
     sobre todas las armaduras para encontrar la correcta.
     """
     def __init__(self):
-        print("✅ Conversor Directo XML->MIDI (con ligaduras y armadura) inicializado.")
+        log.info("✅ Conversor Directo XML->MIDI (con ligaduras y armadura) inicializado.")
         self.SHARPS_TO_MAJOR = {
             0: 'C', 1: 'G', 2: 'D', 3: 'A', 4: 'E', 5: 'B', 6: 'F#', 7: 'C#',
             -1: 'F', -2: 'Bb', -3: 'Eb', -4: 'Ab', -5: 'Db', -6: 'Gb', -7: 'Cb'
@@ -27,11 +197,11 @@ class DirectXMLtoMIDIConverter:
         y mostrando información de depuración.
         """
         try:
-            # 1. Obtenemos TODAS las etiquetas <KeySig> del documento.
-            all_key_sigs = root_node.findall('.//KeySig')
-
+            # 1. Recorremos las etiquetas <KeySig> de forma perezosa: iterfind
+            #    no materializa la lista completa y el return del primer
+            #    resultado válido corta la búsqueda ahí mismo.
             # 2. Iteramos sobre cada una de ellas.
-            for i, ks_node in enumerate(all_key_sigs):
+            for i, ks_node in enumerate(root_node.iterfind('.//KeySig')):
                 
                 # 3. Buscamos la etiqueta 'accidental' DENTRO de la KeySig actual.
                 accidental_node = ks_node.find('accidental')
@@ -52,84 +222,118 @@ class DirectXMLtoMIDIConverter:
                         return result_key # Devolvemos el primer resultado válido y salimos.
                 else:
                     # Esta etiqueta <KeySig> estaba vacía o no tenía <accidental>. La ignoramos.
-                    print(f"[DEBUG] KeySig #{i+1} está vacía o no contiene <accidental>. Se ignora.")
+                    log.debug("KeySig #%d está vacía o no contiene <accidental>. Se ignora.", i + 1)
 
             # Si el bucle termina y no hemos devuelto nada, significa que ninguna era válida.
-            print("[DEBUG] No se encontró ninguna <KeySig> con un valor <accidental> válido.")
+            log.debug("No se encontró ninguna <KeySig> con un valor <accidental> válido.")
             return 'C'
 
         except Exception as e:
-            print(f"[DEBUG] Ocurrió una excepción inesperada durante la búsqueda: {e}")
-            print("--- BÚSQUEDA DE ARMADURA FINALIZADA ---\n")
+            log.debug("Ocurrió una excepción inesperada durante la búsqueda: %s", e)
             return 'C'
     
+    def _load_pruned_score(self, stream):
+        """
+        Parsea el mscx en streaming con iterparse y devuelve un árbol mínimo
+        que contiene el <Division> y los dos primeros <Staff> del <Score>.
+        El resto de elementos se libera según se van cerrando, de modo que
+        nunca se materializa el documento completo en memoria.
+        """
+        division_text = None
+        staves = []
+        tag_stack = []
+        keep_depth = None
+        depth = 0
+
+        for event, elem in ET.iterparse(stream, events=('start', 'end')):
+            if event == 'start':
+                if (keep_depth is None and elem.tag == 'Staff'
+                        and tag_stack and tag_stack[-1] == 'Score'
+                        and len(staves) < 2):
+                    staves.append(elem)
+                    keep_depth = depth
+                tag_stack.append(elem.tag)
+                depth += 1
+                continue
+
+            depth -= 1
+            tag_stack.pop()
+
+            if keep_depth is not None:
+                if depth == keep_depth:
+                    keep_depth = None  # se cerró un Staff retenido; no se limpia
+                continue
+
+            if elem.tag == 'Division' and division_text is None:
+                division_text = elem.text
+            elem.clear()
+
+        # Reconstruir un árbol mínimo con la misma forma que espera convert()
+        pruned = ET.Element('museScore')
+        score = ET.SubElement(pruned, 'Score')
+        if division_text is not None:
+            division = ET.SubElement(score, 'Division')
+            division.text = division_text
+        score.extend(staves)
+        return pruned
+
     # --- RESTO DEL CÓDIGO SIN CAMBIOS ---
-    def get_note_events_from_staff(self, root_node, staff_node):
-        events = []
-        current_tick = 0
-        division = int(root_node.find('.//Division').text)
-        ticks_per_quarter = division
-        duration_map = {
-            'whole': ticks_per_quarter * 4, 'half': ticks_per_quarter * 2,
-            'quarter': ticks_per_quarter, 'eighth': ticks_per_quarter // 2,
-            '16th': ticks_per_quarter // 4, '32nd': ticks_per_quarter // 8,
-            '64th': ticks_per_quarter // 16, 'measure': ticks_per_quarter * 2
-        }
-        duration_map.update({"black": duration_map["quarter"], "breve": duration_map["measure"]})
-        open_ties = {}
-        for measure in staff_node.findall('Measure'):
-            for voice in measure.findall('voice'):
-                for element in voice:
-                    duration_type_node = element.find('durationType')
-                    if duration_type_node is None: continue
-                    duration_type = duration_type_node.text
-                    base_duration = duration_map.get(duration_type, 0)
-                    if element.find('dots') is not None:
-                        base_duration = int(base_duration * 1.5)
-                    if element.tag == 'Chord':
-                        for note_node in element.findall('Note'):
-                            pitch_node = note_node.find('pitch')
-                            if pitch_node is None: continue
-                            pitch = int(pitch_node.text)
-                            is_tied_from_prev = note_node.find(".//Spanner/prev") is not None
-                            is_tied_to_next = note_node.find(".//Spanner/next") is not None
-                            if is_tied_from_prev:
-                                if pitch in open_ties:
-                                    open_ties[pitch] = (open_ties[pitch][0], open_ties[pitch][1] + base_duration)
-                                if not is_tied_to_next:
-                                    if pitch in open_ties:
-                                        start_tick, total_duration = open_ties.pop(pitch)
-                                        events.append({'tick': start_tick, 'type': 'note_on', 'pitch': pitch})
-                                        events.append({'tick': start_tick + total_duration, 'type': 'note_off', 'pitch': pitch})
-                            else:
-                                if is_tied_to_next:
-                                    open_ties[pitch] = (current_tick, base_duration)
-                                else:
-                                    events.append({'tick': current_tick, 'type': 'note_on', 'pitch': pitch})
-                                    events.append({'tick': current_tick + base_duration, 'type': 'note_off', 'pitch': pitch})
-                        current_tick += base_duration
-                    elif element.tag == 'Rest':
-                        current_tick += base_duration
-        return events
+    def get_note_events_from_staff(self, staff_node, ticks_per_quarter):
+        # El <Division> se lee una sola vez en convert() y se pasa como
+        # parámetro: repetir aquí el find('.//Division') recorrería el
+        # árbol otra vez por cada pentagrama
+        return _extract_staff_events(staff_node, ticks_per_quarter)
+
+    def _emit_hand(self, track, ticks, kinds, pitches, channel):
+        """
+        Vuelca los eventos de una mano en su pista con delta-times propios.
+        Los buffers llegan casi siempre ordenados por tick desde la
+        extracción; solo se ordenan aquí si hace falta.
+        """
+        # Las ligaduras retienen su note_off hasta cerrarse, y con varias
+        # voces (el cursor es compartido) ese cierre puede caer cuando el
+        # cursor ya pasó de largo: el note_off entra detrás de eventos con
+        # un tick mayor. Un delta negativo haría fallar a mido al guardar,
+        # así que se comprueba la monotonía y, solo si se rompió, se
+        # restaura el orden con un argsort estable (conserva el orden de
+        # emisión entre eventos del mismo tick).
+        if len(ticks) and (np.diff(ticks) < 0).any():
+            order = np.argsort(ticks, kind='stable')
+            ticks = ticks[order]
+            kinds = kinds[order]
+            pitches = pitches[order]
+        # Buffer predimensionado: el número de mensajes se conoce de
+        # antemano, así que se rellena por índice y se vuelca de una vez,
+        # sin los redimensionados que provocaría un append por evento
+        msgs = [None] * len(ticks)
+        prev_tick = 0
+        for i, (tick, kind, pitch) in enumerate(zip(ticks.tolist(),
+                                                    kinds.tolist(),
+                                                    pitches.tolist())):
+            msgs[i] = mido.Message(_TYPE[kind], note=pitch, velocity=_VEL[kind],
+                                   time=tick - prev_tick, channel=channel)
+            prev_tick = tick
+        track.extend(msgs)
 
     def convert(self, mscz_file, output_file=None):
         input_path = Path(mscz_file)
         if output_file is None: output_path = input_path.with_suffix('.mid')
         else: output_path = Path(output_file)
         try:
+            stat = input_path.stat()
+            score_info = _find_mscx(str(input_path), stat.st_mtime_ns, stat.st_size)
+            if score_info is None: return False
             with zipfile.ZipFile(input_path, 'r') as zip_ref:
-                score_filename = next((f for f in zip_ref.namelist() if f.endswith('.mscx')), None)
-                if not score_filename: return False
-                with zip_ref.open(score_filename) as score_file:
-                    root = ET.fromstring(score_file.read())
+                with zip_ref.open(score_info) as score_file:
+                    root = self._load_pruned_score(io.BufferedReader(score_file))
         except Exception as e:
-            print(f"❌ Error al leer o parsear el archivo MSCZ/XML: {e}")
+            log.error("❌ Error al leer o parsear el archivo MSCZ/XML: %s", e)
             return False
 
         try:
             ticks_per_beat = int(root.find('.//Division').text)
         except (AttributeError, TypeError):
-            print("❌ No se encontró la etiqueta <Division>. No se puede continuar.")
+            log.error("❌ No se encontró la etiqueta <Division>. No se puede continuar.")
             return False
 
         mid = mido.MidiFile(type=1, ticks_per_beat=ticks_per_beat)
@@ -137,39 +341,47 @@ class DirectXMLtoMIDIConverter:
         if len(all_staves) < 2: return False
         
         key_signature_name = self._get_key_signature(root)
-        print(f"🎵 Armadura detectada: {key_signature_name}")
-
-        print("🎼 Procesando pentagramas (con ligaduras)...")
-        right_hand_events = self.get_note_events_from_staff(root, all_staves[0])
-        left_hand_events = self.get_note_events_from_staff(root, all_staves[1])
-        right_track = mido.MidiTrack()
-        right_track.append(mido.MetaMessage('track_name', name='Mano Derecha', time=0))
-        right_track.append(mido.MetaMessage('key_signature', key=key_signature_name, time=0))
-        right_track.append(mido.Message('program_change', channel=0, program=0, time=0))
-        left_track = mido.MidiTrack()
-        left_track.append(mido.MetaMessage('track_name', name='Mano Izquierda', time=0))
-        left_track.append(mido.MetaMessage('key_signature', key=key_signature_name, time=0))
-        left_track.append(mido.Message('program_change', channel=1, program=0, time=0))
-        all_midi_events = right_hand_events + left_hand_events
-        for event in right_hand_events: event['channel'] = 0
-        for event in left_hand_events: event['channel'] = 1
-        all_midi_events.sort(key=lambda e: e['tick'])
-        last_tick_right = 0
-        last_tick_left = 0
-        for event in all_midi_events:
-            velocity = 90 if event['type'] == 'note_on' else 0
-            if event['channel'] == 0:
-                delta_time = event['tick'] - last_tick_right
-                right_track.append(mido.Message(event['type'], note=event['pitch'], velocity=velocity, time=delta_time, channel=0))
-                last_tick_right = event['tick']
-            else:
-                delta_time = event['tick'] - last_tick_left
-                left_track.append(mido.Message(event['type'], note=event['pitch'], velocity=velocity, time=delta_time, channel=1))
-                last_tick_left = event['tick']
-        mid.tracks.append(right_track)
-        mid.tracks.append(left_track)
-        mid.save(str(output_path))
-        print(f"\n🎉 ¡Conversión final completada! Archivo guardado en: {output_path}")
+        log.info("🎵 Armadura detectada: %s", key_signature_name)
+
+        log.info("🎼 Procesando pentagramas (con ligaduras)...")
+        # Los dos pentagramas son independientes y puro CPU: se reparten en
+        # dos procesos (el GIL anularía la ganancia con hilos). Serializar el
+        # subárbol es barato comparado con recorrerlo.
+        staff0_bytes = ET.tostring(all_staves[0])
+        staff1_bytes = ET.tostring(all_staves[1])
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            r_future = executor.submit(_parse_staff_bytes, staff0_bytes, ticks_per_beat)
+            l_future = executor.submit(_parse_staff_bytes, staff1_bytes, ticks_per_beat)
+            r_ticks, r_kinds, r_pitches = r_future.result()
+            l_ticks, l_kinds, l_pitches = l_future.result()
+
+        # Salida temprana: si ningún pentagrama aporta notas no hay nada
+        # que guardar, y se evita construir pistas y escribir un MIDI vacío
+        if len(r_ticks) == 0 and len(l_ticks) == 0:
+            log.error("❌ Ningún pentagrama contiene notas. No se genera el MIDI.")
+            return False
+
+        hands = [('Mano Derecha', 0, r_ticks, r_kinds, r_pitches),
+                 ('Mano Izquierda', 1, l_ticks, l_kinds, l_pitches)]
+        # Cada pista MIDI lleva sus delta-times de forma independiente, así
+        # que no hace falta entremezclar ambas manos para volver a separarlas
+        # después: cada mano se vuelca directamente en su pista. Una mano
+        # sin notas simplemente no genera pista.
+        for name, channel, h_ticks, h_kinds, h_pitches in hands:
+            if len(h_ticks) == 0:
+                log.warning("⚠️ El pentagrama de '%s' no contiene notas; se omite su pista.", name)
+                continue
+            track = mido.MidiTrack()
+            track.append(mido.MetaMessage('track_name', name=name, time=0))
+            track.append(mido.MetaMessage('key_signature', key=key_signature_name, time=0))
+            track.append(mido.Message('program_change', channel=channel, program=0, time=0))
+            self._emit_hand(track, h_ticks, h_kinds, h_pitches, channel=channel)
+            mid.tracks.append(track)
+        # Escritura con un buffer grande: mido serializa el archivo en
+        # escrituras pequeñas y así se agrupan en pocas llamadas al sistema
+        with open(output_path, 'wb', buffering=1 << 20) as f:
+            mid.save(file=f)
+        log.info("🎉 ¡Conversión final completada! Archivo guardado en: %s", output_path)
         return True
 
 # --- Función de conveniencia ---
@@ -179,8 +391,9 @@ def convert_mscz_with_ties(mscz_file, output_file=None):
 
 # --- EJEMPLO DE USO ---
 if __name__ == '__main__':
-    input_score = r"D:\JESUS\PARTITURAS\The Man Who Sold The World.mscz" 
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    input_score = r"D:\JESUS\PARTITURAS\The Man Who Sold The World.mscz"
     if not os.path.exists(input_score):
-        print(f"El archivo de entrada '{input_score}' no existe.")
+        log.error("El archivo de entrada '%s' no existe.", input_score)
     else:
         convert_mscz_with_ties(input_score)
\ No newline at end of file